@@ -11,20 +11,35 @@ dht22 = DHT22(Pin(14))
 temp_c = 0
 temp_f = 32
 humidity = 0
+# Rounded copies are computed once per sensor reading instead of once per API request.
+temp_c_rounded = 0
+temp_f_rounded = 32
+humidity_rounded = 0
 
 # Read values from DHT sensor periodically.
 async def read_dht():
     global temp_c
     global temp_f
     global humidity
+    global temp_c_rounded
+    global temp_f_rounded
+    global humidity_rounded
 
     while (True):
         dht22.measure()
         temp_c = dht22.temperature()
         temp_f = 1.8 * temp_c + 32
         humidity = dht22.humidity()
+        temp_c_rounded = round(temp_c)
+        temp_f_rounded = round(temp_f)
+        humidity_rounded = round(humidity)
         print(f'Temp: {temp_c}C, {temp_f}F  Humidity: {humidity}%')
-        await uasyncio.sleep(15)
+        # Sample faster while clients are actively polling the API so readings stay fresh.
+        # (The DHT22 needs about 2 seconds between measurements.)
+        if api.recently_active():
+            await uasyncio.sleep(2)
+        else:
+            await uasyncio.sleep(15)
 
 
 # Instantiate the Thimble API object.
@@ -33,15 +48,15 @@ api = Thimble()
 # Add routes for reading the DHT-provided values using the default HTTP method of GET.
 @api.route('/temperature/celsius')
 def get_temp_c(req):
-    return round(temp_c)
+    return temp_c_rounded
 
 @api.route('/temperature/fahrenheit')
 def get_temp_f(req):
-    return round(temp_f)
+    return temp_f_rounded
 
 @api.route('/humidity')
 def get_humidity(req):
-    return round(humidity)
+    return humidity_rounded
 
 # Various HTTP methods allow control of the built-in LED.
 @api.route('/nightlight', methods=['GET'])
@@ -1,27 +1,32 @@
 # A pulse-width modulated LED that fades in and out in sync with music with API controlled beats per minute.
 from math import pi, cos
-from config import BPM  # Beats per minute
+from array import array
+from machine import Pin, PWM
+from config import GPIO, BPM  # LED pin and beats per minute
 from thimble import Thimble
 import uasyncio
 
-def pulse_led():
-    a = 0  # Angle in radians.
+led = PWM(Pin(GPIO))
+
+# One full cosine wave precomputed as 256 PWM duty-cycle values. Software floating-point cos()
+# takes hundreds of microseconds on an ESP8266, far too slow for a one millisecond loop, but an
+# array index is nearly free. Cosine ranges from -1 to 1 and PWM amplitude requires 0 to 1023.
+COSINE_TABLE = array('H', (int(cos(step * 2 * pi / 256) * 511 + 512) for step in range(256)))
+
+async def pulse_led():
+    position = 0  # Position in the cosine table, in 8.8 fixed-point so slow pulses still move smoothly.
     while (1):
-        x = cos(a) * 511 + 512  # Cosine ranges from -1 to 1. PWM amplitude requires 0 to 1023.
-        led.duty(int(x))  # LED brightness is controlled by duty cycle.
-        a += increment    # Syncs the LED transition to every two beats.
-        if (a > 2 * pi):  # 2pi radians is one full cycle of the cosine wave.
-            a = 0
+        led.duty(COSINE_TABLE[(position >> 8) & 0xFF])  # LED brightness is controlled by duty cycle.
+        position = (position + increment) & 0xFFFF  # Integer math only; no floats in the hot loop.
         await uasyncio.sleep_ms(1)  # The loop delay is 1 millisecond, which is why beats per ms is important.
 
 def calculate_increment(BPM):
     if BPM <= 0:
         increment = 0
     else:
-        bps = BPM / 60  # Dividing BPM by 60 seconds/minute gives beats per second.
-        bpms = bps / 1000  # Dividing again by 1000 gives beats per millisecond.
-        period = 1 / bpms  # Period is the time between beats (expressed in milliseconds.) 
-        increment = pi / period  # Adding this to angle will get to 180 degrees (pi) in one beat.
+        # One beat covers half the cosine wave, or 128 table steps. Convert beats per minute to
+        # table steps per millisecond tick, scaled by 256 for the fixed-point position.
+        increment = round(128 * 256 * BPM / 60 / 1000)
     return increment
 
 print(f'BPM: {BPM}')
@@ -1,20 +1,267 @@
-from asyncio import get_event_loop, start_server
+from asyncio import TimeoutError, get_event_loop, start_server, wait_for
 from os import stat
-from re import match, search
+from re import compile as re_compile
+
+try:
+    from socket import IPPROTO_TCP, TCP_NODELAY
+except ImportError:  # not every MicroPython port exposes these constants
+    IPPROTO_TCP = TCP_NODELAY = None
+
+try:
+    from time import ticks_diff, ticks_ms  # MicroPython
+except ImportError:
+    from time import monotonic  # CPython (used when unit testing off-device)
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(ticks1, ticks2):
+        return ticks1 - ticks2
+
+
+EMPTY_ROUTE_TABLE = {}  # Shared fallback for lookups on methods with no registered routes. Never written to.
+
+# Canonical HTTP method strings. Mapping a freshly parsed method onto one of these means route
+# lookups compare against the exact same string object registration used, so dict probes can
+# succeed on an identity check instead of comparing characters.
+HTTP_METHODS = {
+    'GET': 'GET',
+    'HEAD': 'HEAD',
+    'POST': 'POST',
+    'PUT': 'PUT',
+    'PATCH': 'PATCH',
+    'DELETE': 'DELETE',
+    'OPTIONS': 'OPTIONS'
+}
+
+
+# Canonical lowercase names for the headers browsers send with nearly every request. Mapping each
+# freshly decoded name through this table replaces per-request duplicates with one shared string,
+# so lookups like req['headers'].get('connection') succeed on an identity check and the duplicates
+# never reach the heap long-term.
+KNOWN_HEADER_NAMES = {
+    'accept': 'accept',
+    'accept-encoding': 'accept-encoding',
+    'accept-language': 'accept-language',
+    'authorization': 'authorization',
+    'cache-control': 'cache-control',
+    'connection': 'connection',
+    'content-length': 'content-length',
+    'content-type': 'content-type',
+    'cookie': 'cookie',
+    'host': 'host',
+    'if-modified-since': 'if-modified-since',
+    'origin': 'origin',
+    'referer': 'referer',
+    'user-agent': 'user-agent'
+}
+
+
+def log_nothing(*args):
+    """
+    Stand-in for print() when debug logging is off, so log call sites need no per-request branch.
+
+    Args:
+        args (any): accepted and ignored
+
+    Returns:
+        nothing
+    """
+
+# Parsing stops after this many request headers. Browsers send a dozen or so; hundreds means a
+# header-flood attempt, and refusing it caps how much heap one request can make the parser allocate.
+MAX_HEADER_COUNT = 32
+
+# Complete status lines are stored as ready-to-send bytes, so no per-request formatting is needed.
+# Kept at module level because MicroPython resolves a module global in one dict lookup, where a
+# class attribute costs an extra attribute walk.
+HTTP_STATUS_LINES = {
+    200: b'HTTP/1.1 200 OK\r\n',
+    302: b'HTTP/1.1 302 Found\r\n',
+    400: b'HTTP/1.1 400 Bad Request\r\n',
+    404: b'HTTP/1.1 404 Not Found\r\n',
+    413: b'HTTP/1.1 413 Payload Too Large\r\n',
+    500: b'HTTP/1.1 500 Internal Server Error\r\n'
+}
+
+HTTP_200_LINE = HTTP_STATUS_LINES[200]  # fast path for the overwhelmingly common status
+
+# Maps (status_code, content_type, content_encoding, keep_alive) to ready-made header bytes.
+RESPONSE_PROLOGUE_CACHE = {}
+
+def parse_query_string(query_string):
+    """
+    Split a URL's query string into individual key/value pairs
+    (ex: 'pet=Panda&color=Red' becomes { "pet": "panda", "color": "red"}
+    Args:
+        query_string (string): the query string portion of a URL (without the leading ? delimiter)
+
+    Returns:
+        dictionary: key/value pairs
+    """
+    # Scanning with find() and slicing straight into the result dict means the only allocations
+    # are the keys and values themselves; split('&') would first build a list of every parameter.
+    # A key with no '=' is kept with an empty value, and extra '=' characters stay in the value.
+    query = {}
+    position = 0
+    query_len = len(query_string)
+    while position < query_len:
+        delimiter = query_string.find('&', position)
+        end = query_len if delimiter < 0 else delimiter
+        separator = query_string.find('=', position, end)
+        if separator < 0:
+            key = query_string[position:end]
+            value = ''
+        else:
+            key = query_string[position:separator]
+            value = query_string[separator + 1:end]
+        if key:
+            query[key] = value
+        position = end + 1
+
+    return query
+
+
+def parse_http_request(req_buffer, buffer_len=None, req=None):
+    """
+    Given a raw HTTP request, return a dictionary with individual elements broken out
+
+    Rather than decoding the whole buffer and splitting it into a list of lines, the buffer is
+    scanned in place with find() and only the slices that are actually needed get decoded.
+    This keeps temporary string allocations to a minimum.
+
+    Args:
+        req_buffer (bytes or bytearray): the unprocessed HTTP request sent from the client
+        buffer_len (int): number of meaningful bytes in req_buffer (defaults to the full buffer)
+        req (dictionary): an earlier result to refill in place, saving two dict allocations
+            per request on a keep-alive connection (a fresh dictionary is made when omitted)
+
+    Returns:
+        dictionary: key/value pairs including, but not limited to method, path, query, headers, body, etc.
+            or None type if parsing fails
+    """
+    if buffer_len is None:
+        buffer_len = len(req_buffer)
+    if buffer_len == 0:  # empty request buffer
+        return None
+
+    if req is None:
+        req = {'headers': {}}
+    else:  # empty out the recycled dictionaries, keeping their already-grown storage
+        headers = req['headers']
+        headers.clear()
+        req.clear()
+        req['headers'] = headers
+
+    line_end = req_buffer.find(b'\r\n', 0, buffer_len)
+    if line_end < 0:  # no request line terminator, so this isn't HTTP
+        return None
+    headers_end = req_buffer.find(b'\r\n\r\n', 0, buffer_len)
+    if headers_end < 0:  # no blank line means no body
+        headers_end = buffer_len
+
+    # The request line looks like: GET /route/path HTTP/1.1
+    # Only the method and target are sliced out. The version is required to be present, but its
+    # value is never used, so it is left in the buffer rather than decoded into a string.
+    method_end = req_buffer.find(b' ', 0, line_end)
+    target_end = req_buffer.find(b' ', method_end + 1, line_end)
+    if method_end < 1 or target_end < 0:
+        return None
+
+    try:
+        req['method'] = str(req_buffer[0:method_end], 'utf8')
+        target = str(req_buffer[method_end + 1:target_end], 'utf8')
+    except UnicodeError:  # binary junk, like a stray TLS hello, rather than text
+        return None
+    req['method'] = HTTP_METHODS.get(req['method'], req['method'])  # swap in the canonical string when known
+    if '?' not in target:
+        req['path'] = target
+    else:  # target can have a query component, so /route/path could be something like /route/path?state=on&timeout=30
+        req['path'], query_string = target.split('?', 1)
+        req['query'] = parse_query_string(query_string)
+
+    position = line_end + 2
+    header_count = 0
+    try:
+        while position < headers_end:
+            header_count += 1
+            if header_count > MAX_HEADER_COUNT:  # header flood; refuse rather than keep allocating
+                return None
+            next_end = req_buffer.find(b'\r\n', position, headers_end)
+            if next_end < 0:  # last header has no trailing delimiter
+                next_end = headers_end
+            separator = req_buffer.find(b':', position, next_end)
+            if separator > 0:
+                name = str(req_buffer[position:separator], 'utf8').strip().lower()
+                name = KNOWN_HEADER_NAMES.get(name, name)  # swap in the shared string for common headers
+                req['headers'][name] = str(req_buffer[separator + 1:next_end], 'utf8').strip()
+            position = next_end + 2
+
+        # Everything after the blank line, bounded by Content-Length, is the body (or blank if no
+        # body.) Bytes past Content-Length belong to the next pipelined request, not this one.
+        if headers_end + 4 <= buffer_len:
+            body_end = buffer_len
+            content_length = req['headers'].get('content-length')
+            if content_length is not None:
+                body_end = min(buffer_len, headers_end + 4 + int(content_length))
+            req['body'] = str(req_buffer[headers_end + 4:body_end], 'utf8')
+        else:
+            req['body'] = ''
+    except UnicodeError:  # header or body bytes aren't valid UTF-8
+        return None
+    except ValueError:  # Content-Length isn't a number
+        return None
+
+    return req
+
+
+def http_status_line(status_code):
+    """
+    Given an HTTP status code (e.g. 200, 404, etc.), return the server response status line
+
+    Args:
+        status_code (int): the HTTP status code as defined by RFC 7231 Respone Status Codes (ex. 200)
+
+    Returns:
+        bytes: HTTP status line with protocol version, numeric status code, and corresponding status text
+    """
+    if status_code == 200:  # nearly every response; one compare beats hashing into the dict
+        return HTTP_200_LINE
+    return HTTP_STATUS_LINES.get(status_code, HTTP_STATUS_LINES[500])
+
 
 class Thimble:
     """
     A tiny web framework in the spirit of Flask, scaled down to run on microcontrollers
     """
     def __init__(self, default_content_type='application/octet-stream', req_buffer_size=1024):
-        self.routes = {}  # Dictionary to map method and URL path combinations to functions
+        self.routes = {}  # Nested dictionaries mapping HTTP method, then URL path, to a function
+        self.regex_routes = {}  # Same, but only for routes whose path contains a regex capture group
+        self.route_cache = {}  # Remembers resolved lookups so regex routes are only scanned once per unique request
+        self.last_route_key = None  # One-slot cache of the most recent lookup, checked before the dictionary
+        self.last_route_result = None
         self.default_content_type = default_content_type
         self.req_buffer_size = req_buffer_size
+        # Request buffers are the largest single allocation per connection, so a small free-list of
+        # them is preallocated and reused. Each entry pairs a bytearray with a memoryview of it so
+        # neither needs to be created at connection time. Concurrent connections beyond the pool
+        # size fall back to a fresh buffer that is not kept.
+        self.req_buffer_pool = [
+            (buffer, memoryview(buffer))
+            for buffer in [bytearray(req_buffer_size) for _ in range(Thimble.req_buffer_pool_size)]
+        ]
+        self.debug = False
+        self.log = log_nothing  # swapped for print() when run() is called with debug=True
+        self.activity_period = 2000  # How long after a request the server counts as busy (milliseconds.)
+        self.last_request_ms = ticks_diff(ticks_ms(), self.activity_period)  # Start out idle.
         self.static_folder = '/static'
         self.directory_index = 'index.html'
+        self.error_response_cache = {}  # Maps (error_number, keep_alive) to a complete ready-to-send error response.
+        self.stat_cache = {}  # Maps file path to size (or None when absent) so repeat requests skip the stat() call
         self.error_text = {
             400: "400: Bad Request",
             404: "404: Not Found",
+            413: "413: Payload Too Large",
             500: "500: Internal Server Error"
         }
         self.media_types = {
@@ -35,120 +282,93 @@ class Thimble:
 
     server_name = 'Thimble (MicroPython)'  # Used in 'Server' response header.
 
-    @staticmethod
-    def parse_query_string(query_string):
-        """
-        Split a URL's query string into individual key/value pairs
-        (ex: 'pet=Panda&color=Red' becomes { "pet": "panda", "color": "red"}
-        Args:
-            query_string (string): the query string portion of a URL (without the leading ? delimiter)
+    keep_alive_timeout = 5  # Seconds an idle keep-alive connection is held open before the server closes it.
 
-        Returns:
-            dictionary: key/value pairs
-        """
-        query = {}
-        query_params = query_string.split('&')
-        for param in query_params:
-            if '=' not in param:  # A key with no value, like: 'red' instead of 'color=red'
-                key = param
-                query[key] = ''
-            else:
-                key, value = param.split('=')
-                query[key] = value
+    req_buffer_pool_size = 4  # How many reusable request buffers are kept for concurrent connections.
 
-        return query
+    # Bytes of file data sent per write/drain cycle. Larger values mean fewer event-loop trips per
+    # file at the cost of a bigger transient buffer; ports with more RAM can raise this.
+    file_chunk_size = 2048
 
-    @staticmethod
-    async def parse_http_request(req_buffer):
-        """
-        Given a raw HTTP request, return a dictionary with individual elements broken out
+    stat_cache_size = 32  # Most file paths whose stat() results are remembered at one time.
 
-        Args:
-            req_buffer (bytes): the unprocessed HTTP request sent from the client
+    # Most resolved routes remembered at one time. Wildcard routes match unboundedly many URLs,
+    # and every unique hit is client-chosen, so an uncapped cache is an invitation to exhaust the
+    # heap from outside.
+    route_cache_size = 32
 
-        Raises:
-            exception: when the request buffer is empty
-
-        Returns:
-            dictionary: key/value pairs including, but not limited to method, path, query, headers, body, etc.
-                or None type if parsing fails
-        """
-        assert (req_buffer != b''), 'Empty request buffer.'
-
-        req = {}
-        req_buffer_string = req_buffer.decode('utf8')
-        req_buffer_lines = req_buffer_string.split('\r\n')
-        del req_buffer_string  # free up for garbage collection
-
-        req['method'], target, req['http_version'] = req_buffer_lines[0].split(
-            ' ', 2)  # Example: GET /route/path HTTP/1.1
-        if '?' not in target:
-            req['path'] = target
-        else:  # target can have a query component, so /route/path could be something like /route/path?state=on&timeout=30
-            req['path'], query_string = target.split('?', 1)
-            req['query'] = Thimble.parse_query_string(query_string)
-
-        req['headers'] = {}
-        for i in range(1, len(req_buffer_lines) - 1):
-            # Blank line signifies the end of headers.
-            if req_buffer_lines[i] == '':
-                break
-            else:
-                name, value = req_buffer_lines[i].split(':', 1)
-                req['headers'][name.strip().lower()] = value.strip()
-
-        # Last line is the body (or blank if no body.)
-        req['body'] = req_buffer_lines[len(req_buffer_lines) - 1]
-
-        return req
+    # Pending-connection queue for the listening socket. A multi-asset page load opens several
+    # connections at once, and a queue of 5 refused the burst; ports with more RAM can raise this.
+    backlog = 16
 
     @staticmethod
-    async def http_status_line(status_code):
+    def http_response_prologue(status_code, content_type='', content_encoding='', keep_alive=False):
         """
-        Given an HTTP status code (e.g. 200, 404, etc.), format the server response status line
+        Return everything up to the Content-Length value as pre-encoded bytes, building it only on first use.
+        Responses differ only in Content-Length and body, so the rest can be cached and reused.
 
         Args:
             status_code (int): the HTTP status code as defined by RFC 7231 Respone Status Codes (ex. 200)
+            content_type (string): media-type of body, used for Content-Type header
+            content_encoding(string): compression type, used for Content-Encoding header
+            keep_alive (boolean): True when the connection will be held open for further requests
 
         Returns:
-            string: HTTP status line with protocol version, numeric status code, and corresponding status text
-        """
-        http_status_message = {
-            200: "200 OK",
-            302: "302 Found",
-            400: "400 Bad Request",
-            404: "404 Not Found",
-            500: "500 Internal Server Error"
-        }
-
-        if status_code is None or status_code not in http_status_message:
-            status_code = 500
-
-        return f'HTTP/1.1 {http_status_message[status_code]}\r\n'
+            bytes: status line and headers, ending with 'Content-Length: ' ready for the value to be appended
+        """
+        cache_key = (status_code, content_type, content_encoding, keep_alive)
+        prologue = RESPONSE_PROLOGUE_CACHE.get(cache_key)
+        if prologue is None:
+            prologue = http_status_line(status_code)
+            if keep_alive:
+                prologue += f'Connection: keep-alive\r\nKeep-Alive: timeout={Thimble.keep_alive_timeout}\r\n'.encode()
+            else:
+                prologue += b'Connection: close\r\n'
+            if content_encoding != '':
+                prologue += f'Content-Encoding: {content_encoding}\r\n'.encode()
+            if content_type != '':
+                prologue += f'Content-Type: {content_type}\r\n'.encode()
+            prologue += f'Server: {Thimble.server_name}\r\n'.encode() + b'Content-Length: '
+            RESPONSE_PROLOGUE_CACHE[cache_key] = prologue
+
+        return prologue
+
+    # The request parser and status-line helpers live at module scope because resolving a module
+    # global is a single dict lookup on MicroPython, where Thimble.parse_http_request costs a
+    # global load plus an attribute walk on every request. The assignments below keep the
+    # published Thimble.* names working.
+    parse_query_string = staticmethod(parse_query_string)
+    parse_http_request = staticmethod(parse_http_request)
+    http_status_line = staticmethod(http_status_line)
 
     @staticmethod
-    async def http_headers(content_length=0, content_type='', content_encoding=''):
+    def http_headers(content_length=0, content_type='', content_encoding=''):
         """
         Generate appropriate HTTP response headers based on content properties
 
+        Headers are produced as bytes, because that is what the stream writer ultimately needs;
+        returning a string here just meant every caller paid for an encode of the same text.
+
         Args:
             content_length (int): length of body, used for Content-Length header
             content_type (string): media-type of body, used for Content-Type header
             content_encoding(string): compression type, used for Content-Encoding header
 
         Returns:
-            string: HTTP headers separated by \r\n
+            bytes: HTTP headers separated by \r\n
         """
-        headers = 'Connection: close\r\n'
+        # Collecting the parts and joining once allocates a single result, where += would build a
+        # new intermediate bytes object for every header appended.
+        parts = [b'Connection: close\r\n']
         if content_encoding != '':
-            headers += f'Content-Encoding: {content_encoding}\r\n'
-        headers += f'Content-Length: {content_length}\r\n'
+            parts.append(f'Content-Encoding: {content_encoding}\r\n'.encode())
+        parts.append(f'Content-Length: {content_length}\r\n'.encode())
         if content_type != '':
-            headers += f'Content-Type: {content_type}\r\n'
-        headers += f'Server: {Thimble.server_name}\r\n'
-        headers += '\r\n'  # blank line signifies end of headers
+            parts.append(f'Content-Type: {content_type}\r\n'.encode())
+        parts.append(f'Server: {Thimble.server_name}\r\n'.encode())
+        parts.append(b'\r\n')  # blank line signifies end of headers
 
-        return headers
+        return b''.join(parts)
 
     # MicroPython does not have a built-in types module, so to avoid external dependencies this method lets
     # Thimble determine if route functions should be awaited or not by comparing their type to known async
@@ -172,50 +392,57 @@ class Thimble:
         else:
             return None  # It's not a function
 
-    async def send_error(self, error_number, writer):
+    async def send_error(self, error_number, writer, keep_alive=False):
         """
         Given a stream and an HTTP error number, send a friendly text error message.
 
         Args:
             error_number (integer): HTTP status code
             writer (object): the asyncio Stream object to which the file should be sent
+            keep_alive (boolean): True when the connection will be held open for further requests
 
         Returns:
             nothing
         """
-        writer.write(await Thimble.http_status_line(error_number))
-        error_text = f'{self.error_text[error_number]}\r\n'
-        writer.write(await Thimble.http_headers(content_type='text/plain', content_length=len(error_text)))
-        writer.write(error_text)
+        # Error replies never vary for a given status and connection mode, so the fully assembled
+        # response is built once and replayed as a single constant write from then on.
+        cache_key = (error_number, keep_alive)
+        response = self.error_response_cache.get(cache_key)
+        if response is None:
+            error_text = f'{self.error_text[error_number]}\r\n'.encode()
+            prologue = Thimble.http_response_prologue(error_number, content_type='text/plain', keep_alive=keep_alive)
+            response = b''.join((prologue, str(len(error_text)).encode(), b'\r\n\r\n', error_text))
+            self.error_response_cache[cache_key] = response
+        writer.write(response)
         await writer.drain()
 
-    async def send_function_results(self, func, req, url_wildcard, writer):
+    async def send_function_results(self, func, is_coro, req, url_wildcard, writer, keep_alive=False):
         """
         Execute the given function with the HTTP reqest parameters as an argument and send the results as an HTTP reply
 
         Args:
-            func (object): reference to the function to be executed or a tuple of function and URL wildcard
+            func (object): reference to the function to be executed
+            is_coro (boolean): True when the function was registered as async and must be awaited
             req (dictionary): HTTP request parameters
             url_wildcard (various types): regex-matched portion of the url_path (or None for non-regex routes)
             writer (object): the asyncio Stream object to which the results should be sent
+            keep_alive (boolean): True when the connection will be held open for further requests
 
         Returns:
             nothing
         """
         try:
-            if Thimble.is_async(func) is True:  # await the async function
-                if url_wildcard is not None:
-                    func_result = await func(req, url_wildcard)
-                else:
-                    func_result = await func(req)
-            else:  # no awaiting required for non-async
-                if url_wildcard is not None:
-                    func_result = func(req, url_wildcard)
-                else:
-                    func_result = func(req)
+            # Whether func needs awaiting was determined when the route was registered, so the
+            # only per-request decision left is the argument shape.
+            if url_wildcard is not None:
+                func_result = func(req, url_wildcard)
+            else:
+                func_result = func(req)
+            if is_coro:
+                func_result = await func_result
 
         except Exception as ex:
-            await self.send_error(500, writer)
+            await self.send_error(500, writer, keep_alive=keep_alive)
             print(f'Function call failed: {ex}')
         else:
             if isinstance(func_result, tuple) and len(func_result) == 3:
@@ -228,18 +455,24 @@ class Thimble:
                 status_code = 200
                 content_type = 'text/plain'
 
-            if not isinstance(body, str):
-                body = str(body)
-            writer.write(await Thimble.http_status_line(status_code))
-            writer.write(await Thimble.http_headers(content_length=len(body), content_type=content_type))
-            await writer.drain()
-            writer.write(body)
+            if isinstance(body, (bytes, bytearray)):
+                pass  # already sendable, and Content-Length comes straight from its length
+            elif isinstance(body, str):
+                body = body.encode('utf8')
+            else:  # numbers and anything else printable
+                body = str(body).encode('utf8')
+            prologue = Thimble.http_response_prologue(status_code, content_type=content_type, keep_alive=keep_alive)
+            # One write per response avoids the small-segment TCP behavior seen with multiple sends.
+            # join makes one result buffer instead of a fresh intermediate per concatenation
+            writer.write(b''.join((prologue, str(len(body)).encode(), b'\r\n\r\n', body)))
             await writer.drain()
 
-    @staticmethod
-    async def file_size(file_path):
+    def file_size(self, file_path):
         """
         Given a path to a file, return the file's size or None if there's an exception when checking.
+        Results, including misses, are cached: stat() hits the flash filesystem, and static assets
+        get asked about on every page load while their sizes essentially never change. Call
+        clear_stat_cache() after replacing static content.
 
         Args:
             file_path (string): a fully-qualified path to the location of the file
@@ -247,15 +480,31 @@ class Thimble:
         Returns:
             file size in bytes or None if there was a problem obtaining the size (e.g. file does not exist)
         """
+        if file_path in self.stat_cache:
+            return self.stat_cache[file_path]
 
         try:
             size = stat(file_path)[6]
         except OSError:
             size = None
 
+        if len(self.stat_cache) >= Thimble.stat_cache_size:
+            self.stat_cache.popitem()  # drop an arbitrary entry to stay bounded; no LRU bookkeeping
+        self.stat_cache[file_path] = size
+
         return size
 
-    async def file_type(self, file_path):
+    def clear_stat_cache(self):
+        """
+        Forget all cached file sizes, so the next request re-checks the filesystem.
+        Needed after static files are added, removed, or replaced on a running server.
+
+        Returns:
+            nothing
+        """
+        self.stat_cache.clear()
+
+    def file_type(self, file_path):
         """
         Return a standard media type / subtype based on file extension
 
@@ -265,31 +514,50 @@ class Thimble:
         Returns:
             string: media type as registered with the Internet Assigned Numbers Authority (IANA)
         """
-        file_ext = file_path.split('.')[-1]
-        if file_ext not in self.media_types:
-            return self.default_content_type
-        else:
-            return self.media_types[file_ext]
+        # rpartition scans once from the end and returns a fixed 3-tuple, where split('.') would
+        # build a list of every dot-separated piece just to keep the last one.
+        return self.media_types.get(file_path.rpartition('.')[2], self.default_content_type)
 
     @staticmethod
-    def read_file_chunk(file):
+    async def send_file_chunks(file_path, writer):
         """
-        Given a file handle, read the file in small chunks to avoid large buffer requirements.
+        Given a path to a file, stream its contents in chunks to avoid large buffer requirements.
+        One buffer is allocated up front and refilled with readinto(), rather than allocating a
+        fresh chunk per read the way file.read() does. Every chunk sent is one write plus one
+        drain, so fewer, larger chunks mean fewer trips through the event loop per file.
 
         Args:
-            file (object): the file handle returned by open()
+            file_path (string): a fully-qualified path to the location of the file
+            writer (object): the asyncio Stream object to which the file should be sent
 
         Returns:
-            bytes: a chunk of the file until the file ends, then nothing
+            nothing
         """
-        while True:
-            chunk = file.read(512)  # small chunks to avoid out of memory errors
-            if chunk:
-                yield chunk
-            else:  # empty chunk means end of the file
-                return
-
-    async def send_file_contents(self, file_path, req, writer):
+        with open(file_path, 'rb') as file:
+            # CPython's event loop can hand the file straight to the kernel with sendfile(2), so
+            # the data never passes through Python at all. MicroPython streams have no transport
+            # attribute, which routes them to the chunk loop below.
+            transport = getattr(writer, 'transport', None)
+            if transport is not None and hasattr(get_event_loop(), 'sendfile'):
+                await writer.drain()  # headers must leave the stream buffer before the kernel takes over
+                try:
+                    await get_event_loop().sendfile(transport, file)
+                    return
+                except (OSError, RuntimeError):  # sendfile unavailable on this transport after all
+                    file.seek(0)
+
+            file_buffer = bytearray(Thimble.file_chunk_size)
+            file_buffer_mv = memoryview(file_buffer)
+            while True:
+                bytes_read = file.readinto(file_buffer)
+                if bytes_read == 0:  # nothing read means end of the file
+                    break
+                writer.write(file_buffer_mv[:bytes_read])
+                # The drain can't be batched across chunks: the writer holds a view into the one
+                # buffer, which must be flushed before readinto() overwrites it.
+                await writer.drain()
+
+    async def send_file_contents(self, file_path, req, writer, keep_alive=False):
         """
         Given a file path and an output stream, send HTTP status, headers, and file contents as body.
         If client accepts gzip encoding, and a file of the same name with a .gzip extension appended
@@ -299,34 +567,40 @@ class Thimble:
         Args:
             file_path (string): fully-qualified path to file
             writer (object): the asyncio Stream object to which the file should be sent
+            keep_alive (boolean): True when the connection will be held open for further requests
 
         Returns:
             nothing
         """
         # file_size is also used as an indicator of the file's existence
-        file_gzip_size = await Thimble.file_size(file_path + '.gzip')
-        file_size = await Thimble.file_size(file_path)
-        file_type = await self.file_type(file_path)
+        file_gzip_size = self.file_size(file_path + '.gzip')
+        file_size = self.file_size(file_path)
+        file_type = self.file_type(file_path)
 
         if file_gzip_size is not None and 'accept-encoding' in req['headers'] and 'gzip' in req['headers']['accept-encoding'].lower():
-            writer.write(await Thimble.http_status_line(200))
-            writer.write(await Thimble.http_headers(content_length=file_gzip_size, content_type=file_type, content_encoding='gzip'))
-            with open(file_path + '.gzip', 'rb') as file:
-                for chunk in Thimble.read_file_chunk(file):
-                    writer.write(chunk)
-                    await writer.drain()  # drain immediately after write to avoid memory allocation errors
+            source_path = file_path + '.gzip'
+            source_size = file_gzip_size
+            prologue = Thimble.http_response_prologue(200, content_type=file_type, content_encoding='gzip', keep_alive=keep_alive)
         elif file_size is not None:  # a non-compressed file was found
-            writer.write(await Thimble.http_status_line(200))
-            writer.write(await Thimble.http_headers(content_length=file_size, content_type=file_type))
-            with open(file_path, 'rb') as file:
-                for chunk in Thimble.read_file_chunk(file):
-                    writer.write(chunk)
-                    await writer.drain()
+            source_path = file_path
+            source_size = file_size
+            prologue = Thimble.http_response_prologue(200, content_type=file_type, keep_alive=keep_alive)
         else:  # no file was found
-            await self.send_error(404, writer)
+            await self.send_error(404, writer, keep_alive=keep_alive)
             print(f'Error reading file: {file_path}')
+            return
 
-    def route(self, url_path, methods=['GET']):
+        header = b''.join((prologue, str(source_size).encode(), b'\r\n\r\n'))
+        if source_size <= Thimble.file_chunk_size:  # small asset: headers and body leave in a single write
+            with open(source_path, 'rb') as file:
+                body = file.read(source_size)
+            writer.write(b''.join((header, body)))
+            await writer.drain()
+        else:
+            writer.write(header)
+            await Thimble.send_file_chunks(source_path, writer)
+
+    def route(self, url_path, methods=('GET',)):
         """
         Given a URL path and list of zero or more HTTP methods, add the decorated function to the route table.
 
@@ -344,46 +618,133 @@ class Thimble:
             '<string>': '(.*)'
         }
 
-        regex_match = search('(<.*>)', url_path)
-        if regex_match:
-            url_path = url_path.replace(regex_match.group(
-                1), regex_macros[regex_match.group(1)])
+        # Plain substring replacement beats running the regex engine just to find macro tokens,
+        # and it substitutes every macro in the path rather than only the first.
+        if '<' in url_path:
+            for token, pattern in regex_macros.items():
+                if token in url_path:
+                    url_path = url_path.replace(token, pattern)
 
         def add_route(func):
-            for method in methods:
-                # Methods are uppercase (see RFC 9110)
-                self.routes[method.upper() + url_path] = func
+            # Splitting plain paths from regex patterns at registration means requests for plain
+            # routes never pay for a scan of the regex table. Regex patterns are compiled here,
+            # once, instead of on every request that falls through to the wildcard scan.
+            # Whether the function needs awaiting is decided here, once, and stored alongside it,
+            # so the request dispatcher never has to inspect the function's type.
+            is_coro = Thimble.is_async(func)
+            if '(' in url_path:
+                table = self.regex_routes
+                entry = (re_compile(url_path), func, is_coro)
+            else:
+                table = self.routes
+                entry = (func, is_coro)
+            if len(methods) == 1:  # the overwhelmingly common case; skips the loop machinery
+                table.setdefault(methods[0].upper(), {})[url_path] = entry  # Methods are uppercase (see RFC 9110)
+            else:
+                for method in methods:
+                    table.setdefault(method.upper(), {})[url_path] = entry
+            self.route_cache.clear()  # drop stale lookups in case routes are added after serving starts
+            self.last_route_key = None
+            return func  # hand the function back so decorators can stack and the name stays bound
 
         return add_route
 
-    def resolve_route(self, route_pattern):
+    def cached_route(self, url_path, methods=('GET',)):
+        """
+        Like route(), but the decorated function is called at most once. The first result is
+        remembered and replayed for every request after that, so routes that always return the
+        same thing skip their function call entirely. Only use this for routes whose result
+        never changes; wildcard paths and sensor readings do not belong here.
+
+        Args:
+            url_path (string): path portion of a URL (ex. '/path/to/thing') that will trigger a call to the function
+            methods (list): a list of any HTTP methods (eg. ['GET', 'PUT']) that are used to trigger the call
+
+        Returns:
+            object: wrapper function
         """
-        Given a route pattern (METHOD + url_path), look up the corresponding function.
+        def add_cached_route(func):
+            cache = []  # a closure rather than a dict entry, because MicroPython functions can't hold attributes
+            if Thimble.is_async(func) is True:
+                async def cached_func(req):
+                    if not cache:
+                        cache.append(await func(req))
+                    return cache[0]
+            else:
+                def cached_func(req):
+                    if not cache:
+                        cache.append(func(req))
+                    return cache[0]
+            self.route(url_path, methods)(cached_func)
+            return func
+
+        return add_cached_route
+
+    def resolve_route(self, method, url_path):
+        """
+        Given an HTTP method and URL path, look up the corresponding function.
 
         Args:
-            route_pattern (string): An uppercase HTTP method concatenated with a URL path wich may contain regex (ex: GET/gpio/([0-9+])$)
+            method (string): an uppercase HTTP method (ex: 'GET')
+            url_path (string): the path portion of the requested URL (ex: '/gpio/2')
 
         Returns:
-            object: reference to function (for non-regex URLs) or tuple with function and regex capture (for regex URLs)
+            tuple: function, True if it must be awaited, and the regex capture (None for non-regex URLs),
+                or None type when no route matches
         """
+        # A client polling one URL repeats the same lookup over and over, so the very last hit is
+        # remembered separately. With interned method strings the tuple compare is two pointer
+        # checks, cheaper than even a single dict probe.
+        route_key = (method, url_path)
+        if route_key == self.last_route_key:
+            return self.last_route_result
+
+        result = self.route_cache.get(route_key)
+        if result is not None:  # this exact request was resolved before
+            self.last_route_key = route_key
+            self.last_route_result = result
+            return result
+
         result = None
-        if route_pattern in self.routes:  # pattern is a fixed string, like: 'GET/gpio/2'
-            result = self.routes[route_pattern]
-        else:  # pattern may contain regex, like 'GET/gpio/([0-9]+)'
-            for key in self.routes.keys():
-                regex_match = match(key, route_pattern)
+        entry = self.routes.get(method, EMPTY_ROUTE_TABLE).get(url_path)  # paths that are fixed strings, like: '/gpio/2'
+        if entry is not None:
+            result = (entry[0], entry[1], None)
+        else:  # path may match a regex route, like '/gpio/([0-9]+)'
+            for pattern, func, is_coro in self.regex_routes.get(method, EMPTY_ROUTE_TABLE).values():
+                regex_match = pattern.match(url_path)
                 if regex_match:
-                    func = self.routes[key]
                     wildcard_value = regex_match.group(1)
-                    if self.debug:
-                        print(f'Wildcard match: {wildcard_value}')
-                    result = func, wildcard_value
+                    self.log('Wildcard match:', wildcard_value)
+                    result = (func, is_coro, wildcard_value)
+
+        # Only successful lookups are cached. Caching misses would let unknown URLs grow the cache
+        # without bound, and wildcard hits are capped for the same reason.
+        if result is not None:
+            if len(self.route_cache) >= Thimble.route_cache_size:  # full; drop an entry to stay bounded
+                self.route_cache.popitem()
+            self.route_cache[route_key] = result
+            self.last_route_key = route_key
+            self.last_route_result = result
 
         return result
 
+    def recently_active(self):
+        """
+        Report whether a request arrived within the last activity_period milliseconds.
+        Sensor-polling coroutines can use this to shorten their sleep interval while clients are
+        actively making requests and stretch it back out when things go quiet, a form of adaptive
+        duty cycling that keeps readings fresh without burning power on an idle device.
+
+        Returns:
+            boolean: True if a request was handled recently, False if the server is idle
+        """
+        return ticks_diff(ticks_ms(), self.last_request_ms) < self.activity_period
+
     async def on_connect(self, reader, writer):
         """
-        Connection handler for new client requests.
+        Connection handler for new client requests. Connections are kept open for further requests
+        (HTTP keep-alive) until the client closes, asks for 'Connection: close', or sits idle past
+        the keep-alive timeout, saving a TCP handshake per request for clients that poll.
 
         Args:
             reader (stream): input received from the client
@@ -393,36 +754,136 @@ class Thimble:
             nothing
         """
         client_ip = writer.get_extra_info('peername')[0]
-        if self.debug:
-            print(f'Connection from client: {client_ip}')
+        self.log('Connection from client:', client_ip)
+
+        # Disable Nagle's algorithm so small responses go out immediately instead of stalling
+        # behind delayed ACKs. uasyncio streams keep the raw socket in the 's' attribute.
+        if TCP_NODELAY is not None:
+            try:
+                writer.s.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+            except (AttributeError, OSError):
+                pass  # not fatal, just slower on stacks that buffer small segments
+
+        if self.req_buffer_pool:
+            req_buffer, req_buffer_mv = self.req_buffer_pool.pop()
+        else:  # pool exhausted by concurrent connections, so this one gets a throwaway buffer
+            req_buffer = bytearray(self.req_buffer_size)
+            req_buffer_mv = memoryview(req_buffer)
 
         try:
-            req_buffer = await reader.read(self.req_buffer_size)
-            req = await Thimble.parse_http_request(req_buffer)
-            if self.debug:
-                print(f'Request: {req}')
-        except Exception as ex:
-            await self.send_error(400, writer)
-            print(f'Unable to parse request: {ex}')
-        else:
-            route_value = self.resolve_route(req['method'] + req['path'])
-            if isinstance(route_value, tuple):  # a function and URL wildcard value were returned
-                await self.send_function_results(route_value[0], req, route_value[1], writer)
-            elif route_value is not None:  # just a function was returned
-                await self.send_function_results(route_value, req, None, writer)
-            else:  # nothing returned, try delivering static content instead
-                file_path = self.static_folder + req['path']
-                if file_path.endswith('/'):  # '/path/to/' becomes '/path/to/index.html'
-                    file_path = file_path + self.directory_index
-                await self.send_file_contents(file_path, req, writer)
+            await self.serve_requests(reader, writer, req_buffer, req_buffer_mv)
+        finally:
+            if len(self.req_buffer_pool) < Thimble.req_buffer_pool_size:
+                self.req_buffer_pool.append((req_buffer, req_buffer_mv))
 
-        await writer.drain()
+        # Closing the writer is enough: start_server hands the same stream in as both reader and
+        # writer on MicroPython, and CPython readers have no close of their own.
         writer.close()
         await writer.wait_closed()
-        reader.close()
-        await reader.wait_closed()
-        if self.debug:
-            print(f'Connection closed for {client_ip}')
+        self.log('Connection closed for', client_ip)
+
+    async def serve_requests(self, reader, writer, req_buffer, req_buffer_mv):
+        """
+        Request loop for a single connection, reading and answering requests until it closes.
+
+        Args:
+            reader (stream): input received from the client
+            writer (stream): output to be sent to the client
+            req_buffer (bytearray): reusable buffer that incoming requests are read into
+            req_buffer_mv (memoryview): view of req_buffer for filling it without copies
+
+        Returns:
+            nothing
+        """
+        has_readinto = hasattr(reader, 'readinto')  # CPython's stream reader lacks readinto
+        req_scratch = {'headers': {}}  # refilled by the parser for each request on this connection
+        leftover = 0  # bytes of the next pipelined request already sitting at the front of the buffer
+        while True:
+            # TCP is a stream, so one read may deliver only part of a request. Keep reading until
+            # the blank line ending the headers shows up, the buffer fills, or the client quits.
+            bytes_read = leftover
+            leftover = 0
+            headers_end = req_buffer.find(b'\r\n\r\n', 0, bytes_read)
+            while headers_end < 0 and bytes_read < self.req_buffer_size:
+                try:
+                    if has_readinto:
+                        count = await wait_for(reader.readinto(req_buffer_mv[bytes_read:]), Thimble.keep_alive_timeout)
+                    else:  # fall back to read plus a copy into the reusable buffer
+                        data = await wait_for(reader.read(self.req_buffer_size - bytes_read), Thimble.keep_alive_timeout)
+                        count = len(data)
+                        req_buffer_mv[bytes_read:bytes_read + count] = data
+                except TimeoutError:  # client sat idle too long
+                    count = 0
+                if count == 0:  # closed connection, or gave up mid-request
+                    break
+                bytes_read += count
+                headers_end = req_buffer.find(b'\r\n\r\n', 0, bytes_read)
+            if bytes_read == 0:  # client closed its end of the connection or sat idle too long
+                break
+            if headers_end < 0:  # connection gave out before the headers ended
+                if bytes_read == self.req_buffer_size:  # request can't fit in the buffer
+                    await self.send_error(413, writer)
+                else:  # stalled or closed mid-request; a truncated buffer must never be dispatched
+                    await self.send_error(400, writer)
+                break
+            self.last_request_ms = ticks_ms()
+
+            body_start = headers_end + 4
+            req = parse_http_request(req_buffer, body_start, req_scratch)  # headers only; the body is read below
+            if req is None:  # not parsable as an HTTP request
+                await self.send_error(400, writer)
+                print('Unable to parse request.')
+                break
+            try:
+                content_length = int(req['headers'].get('content-length', 0))
+            except ValueError:  # Content-Length isn't a number
+                await self.send_error(400, writer)
+                break
+            if content_length < 0:
+                await self.send_error(400, writer)
+                break
+            request_end = body_start + content_length
+            if request_end > self.req_buffer_size:  # body can't fit in the buffer
+                await self.send_error(413, writer)
+                break
+            while bytes_read < request_end:  # body bytes are still in flight behind the headers
+                try:
+                    if has_readinto:
+                        count = await wait_for(reader.readinto(req_buffer_mv[bytes_read:request_end]), Thimble.keep_alive_timeout)
+                    else:
+                        data = await wait_for(reader.read(request_end - bytes_read), Thimble.keep_alive_timeout)
+                        count = len(data)
+                        req_buffer_mv[bytes_read:bytes_read + count] = data
+                except TimeoutError:
+                    count = 0
+                if count == 0:
+                    break
+                bytes_read += count
+            if bytes_read < request_end:  # client gave up mid-body
+                break
+            try:
+                req['body'] = str(req_buffer[body_start:request_end], 'utf8')
+            except UnicodeError:  # body bytes aren't valid UTF-8
+                await self.send_error(400, writer)
+                break
+            leftover = bytes_read - request_end
+            if leftover:  # a pipelined request has started; slide it to the front for the next pass
+                req_buffer[0:leftover] = req_buffer[request_end:bytes_read]
+            self.log('Request:', req)
+
+            keep_alive = req['headers'].get('connection', 'keep-alive').lower() != 'close'
+            route_value = self.resolve_route(req['method'], req['path'])
+            if route_value is not None:
+                func, is_coro, url_wildcard = route_value
+                await self.send_function_results(func, is_coro, req, url_wildcard, writer, keep_alive=keep_alive)
+            else:  # no route matched, try delivering static content instead
+                file_path = self.static_folder + req['path']
+                if file_path[-1] == '/':  # '/path/to/' becomes '/path/to/index.html'
+                    file_path += self.directory_index
+                await self.send_file_contents(file_path, req, writer, keep_alive=keep_alive)
+
+            if not keep_alive:
+                break
 
     def run(self, host='0.0.0.0', port=80, loop=None, debug=False):
         """
@@ -438,15 +899,14 @@ class Thimble:
             object: the same loop object given as a parameter or a new one if no existing loop was passed
         """
         self.debug = debug
+        self.log = print if debug else log_nothing
         print(f'Listening on {host}:{port}')
 
+        run_forever = loop is None  # Only take over the loop when the caller didn't supply one.
         if loop is None:
             loop = get_event_loop()
-            server = start_server(self.on_connect, host, port, 5)
-            loop.create_task(server)
+        loop.create_task(start_server(self.on_connect, host, port, Thimble.backlog))
+        if run_forever:
             loop.run_forever()
-        else:
-            server = start_server(self.on_connect, host, port, 5)
-            loop.create_task(server)
 
         return loop